@@ -14,10 +14,72 @@
 ## limitations under the License.
 ##============================================================================
 
-from flask import Flask
-app = Flask(__name__)
+"""
+Lulz History: lolcommits + GitHub history.
 
-app.config.from_envvar('LULZ_CONF')
+Importing the package is cheap: the application (and everything it
+needs: configuration, GitHub clients, caches..) is only built by
+:py:func:`create_app`.
+"""
 
-from LulzHistory import auth
-from LulzHistory import views
+
+def create_app(config=None, preload=False):
+    """
+    Application factory.
+
+    :param config:
+        The configuration to use. Can be a dictionary, the path
+        to a configuration file or ``None``, to load the file
+        pointed by the ``LULZ_CONF`` environment variable.
+
+    :param preload:
+        If true, build all the shared state (GitHub clients,
+        caches, regexps..) right away, instead of on first use.
+        Use this when creating the application in the master
+        process of a pre-forking server (eg. ``gunicorn --preload``).
+
+    If the ``ASSETS_BUILD`` configuration option is set, the static
+    assets are built (see :py:mod:`LulzHistory.assets`) in
+    ``ASSETS_DIR`` (defaults to ``assets`` in the instance folder).
+
+    :return:
+        The Flask application
+    """
+    import os
+    from flask import Flask
+    from .state import AppState, EXTENSION_NAME
+
+    app = Flask(__name__)
+
+    if config is None:
+        app.config.from_envvar('LULZ_CONF')
+    elif isinstance(config, basestring):
+        app.config.from_pyfile(config)
+    else:
+        app.config.update(config)
+
+    app.config.setdefault('ASSETS_DIR',
+                          os.path.join(app.instance_path, 'assets'))
+    app.config.setdefault('ASSETS_BUILD', False)
+
+    ## Importing the modules registers views on the blueprint
+    from . import assets, auth, views  # noqa
+    from .blueprint import bp
+    app.register_blueprint(bp)
+
+    if app.config['ASSETS_BUILD']:
+        try:
+            assets.build_assets(app.config['ASSETS_DIR'])
+        except (IOError, OSError):
+            ## Not fatal: without a manifest, files are
+            ## served by the default static handler
+            app.logger.exception(
+                "Unable to build static assets in %s",
+                app.config['ASSETS_DIR'])
+
+    state = AppState(app.config)
+    app.extensions[EXTENSION_NAME] = state
+    if preload:
+        state.preload()
+
+    return app
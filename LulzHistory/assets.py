@@ -0,0 +1,312 @@
+##=============================================================================
+## Copyright 2013 Samuele Santi
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##     http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+##=============================================================================
+
+"""
+Static assets pipeline.
+
+The files in ``static/`` are copied to the assets directory with
+a content hash in their name (``style.css`` -> ``style.<hash>.css``),
+minified and precompressed (``.gz`` and, if available, ``.br``).
+A ``manifest.json`` maps the original names to the hashed ones.
+
+Since a hashed file never changes, it is served with a long-lived
+``Cache-Control``, picking the precompressed variant the client
+accepts.
+
+Assets can be rebuilt (eg. with ``lulz-build-assets``) while the
+server is running: the manifest is reloaded when it changes. Old
+hashed files are never removed (and are still served), as pages
+(or caches) out there may still reference them; delete the assets
+directory and rebuild to clean them up.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+from flask import request, url_for, send_from_directory, abort
+from flask import safe_join
+from werkzeug.exceptions import NotFound
+
+from .blueprint import bp
+from .state import get_state
+
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+MANIFEST_NAME = 'manifest.json'
+
+## Only worth compressing text-based files (images are already
+## compressed; fonts such as woff are too)
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt',
+                           '.json', '.ttf', '.eot', '.otf')
+
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+
+## Matches the names written by build_assets() (not the manifest,
+## nor the precompressed variants, as they end in .gz / .br)
+hashed_name_re = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+## Matches url(...) references in stylesheets
+css_url_re = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _minify(content, ext):
+    """
+    Minify CSS / JavaScript, if the (optional) ``rcssmin`` /
+    ``rjsmin`` libraries are available; else, return content
+    unchanged.
+    """
+    try:
+        if ext == '.css':
+            from rcssmin import cssmin
+            return cssmin(content.decode('utf-8')).encode('utf-8')
+        if ext == '.js':
+            from rjsmin import jsmin
+            return jsmin(content.decode('utf-8')).encode('utf-8')
+    except ImportError:
+        pass
+    return content
+
+
+def _gzip(content):
+    buf = io.BytesIO()
+    ## mtime=0 so that builds are reproducible
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=9,
+                       fileobj=buf, mtime=0) as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+def _brotli(content):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(content, quality=11)
+
+
+def _write_file(path, content):
+    """
+    Atomically write a file, so that concurrent builds (eg. from
+    several workers starting up) never see partial files.
+    """
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            if not os.path.isdir(dirname):
+                raise
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.chmod(tmpname, 0o644)
+    os.rename(tmpname, path)
+
+
+def _rewrite_css_urls(content, name, manifest):
+    """
+    Point ``url()`` references in a stylesheet to the hashed
+    version of the referenced files.
+    """
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)  # data:, absolute, ..
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        target = posixpath.normpath(posixpath.join(base, path))
+        if target not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[target], base or '.')
+        return 'url({0}{1}{2}{0})'.format(quote, hashed, suffix)
+
+    return css_url_re.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _list_files(static_dir):
+    """List (relative, posix-style) names of files in a directory"""
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.startswith('.') or filename.endswith('~'):
+                continue
+            path = os.path.join(dirpath, filename)
+            yield os.path.relpath(path, static_dir).replace(os.sep, '/')
+
+
+def build_assets(output_dir, static_dir=STATIC_DIR):
+    """
+    Build fingerprinted, minified and precompressed copies of
+    the static files.
+
+    Files whose hashed version already exists are not written
+    (nor compressed) again, so running this on every startup is
+    cheap.
+
+    :param output_dir:
+        Directory where to write the assets and manifest
+
+    :param static_dir:
+        Directory containing the source files
+
+    :return:
+        The manifest, as a dictionary mapping original names
+        to hashed ones
+    """
+    names = list(_list_files(static_dir))
+
+    ## Stylesheets go last, as they need to reference the
+    ## hashed names of images / fonts
+    names.sort(key=lambda n: posixpath.splitext(n)[1] == '.css')
+
+    manifest = {}
+    for name in names:
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            content = f.read()
+        base, ext = posixpath.splitext(name)
+
+        if ext == '.css':
+            content = _rewrite_css_urls(content, name, manifest)
+        if not base.endswith('.min'):
+            content = _minify(content, ext)
+
+        ## Hash the final content: the same URL must always serve
+        ## the same bytes, as clients cache them forever
+        digest = hashlib.md5(content).hexdigest()[:12]
+        hashed = '{0}.{1}{2}'.format(base, digest, ext)
+        manifest[name] = hashed
+
+        path = os.path.join(output_dir, *hashed.split('/'))
+        if os.path.exists(path):
+            continue  # Same name, same content
+
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            for suffix, compress in (('.gz', _gzip), ('.br', _brotli)):
+                compressed = compress(content)
+                if compressed is not None and \
+                        len(compressed) < len(content):
+                    _write_file(path + suffix, compressed)
+
+        ## Written last, as it marks the file as "done"
+        _write_file(path, content)
+
+    manifest_json = json.dumps(manifest, indent=2, sort_keys=True)
+    _write_file(os.path.join(output_dir, MANIFEST_NAME),
+                manifest_json.encode('utf-8'))
+    return manifest
+
+
+def load_manifest(output_dir):
+    """Load the manifest, or return an empty one if not built yet"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+
+
+class Manifest(object):
+    """
+    The assets manifest, reloaded whenever the file changes.
+
+    :param output_dir:
+        Directory containing the assets and manifest
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._mtime = None
+        self._files = {}
+        self._check()
+
+    def _check(self):
+        try:
+            mtime = os.path.getmtime(
+                os.path.join(self.output_dir, MANIFEST_NAME))
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self._files = load_manifest(self.output_dir)
+            self._mtime = mtime
+
+    def get(self, name):
+        """Get the hashed name for a file, or ``None``"""
+        self._check()
+        return self._files.get(name)
+
+
+@bp.app_template_global()
+def asset_url(filename):
+    """
+    Get the URL for a static file: the hashed version if assets
+    were built, else the one served by the default static handler.
+    """
+    hashed = get_state().assets_manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('lulz.asset', filename=hashed)
+
+
+def is_hashed_asset(output_dir, filename):
+    """
+    Whether ``filename`` is a hashed file in the assets directory.
+
+    Files from previous builds count too: pages (or caches) built
+    before a rebuild may still be referencing them.
+    """
+    if not hashed_name_re.search(filename):
+        return False
+    if any(part.startswith('.') for part in filename.split('/')):
+        return False  # Temporary files, ..
+    try:
+        path = safe_join(output_dir, filename)
+    except NotFound:
+        return False
+    return path is not None and os.path.isfile(path)
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    state = get_state()
+    if not is_hashed_asset(state.assets_dir, filename):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or \
+        'application/octet-stream'
+
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] <= 0:
+            continue
+        if os.path.exists(os.path.join(state.assets_dir, filename + suffix)):
+            response = send_from_directory(
+                state.assets_dir, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(
+            state.assets_dir, filename, mimetype=mimetype)
+
+    response.headers['Cache-Control'] = CACHE_CONTROL_IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
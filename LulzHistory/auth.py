@@ -22,24 +22,9 @@ import json
 from functools import wraps
 
 from flask import url_for, session, request, redirect, make_response
-from rauth.service import OAuth2Service
 
-from . import app
-
-CLIENT_ID = app.config['GITHUB_CLIENT_ID']
-CLIENT_SECRET = app.config['GITHUB_CLIENT_SECRET']
-#GITHUB_SCOPE = 'user:email,repo'
-GITHUB_SCOPE = ''
-
-
-github = OAuth2Service(
-    name='github',
-    base_url='https://api.github.com/',
-    access_token_url='https://github.com/login/oauth/access_token',
-    authorize_url='https://github.com/login/oauth/authorize',
-    client_id=CLIENT_ID,
-    client_secret=CLIENT_SECRET,
-)
+from .blueprint import bp
+from .state import get_state, GITHUB_SCOPE
 
 
 def require_github(func):
@@ -49,36 +34,36 @@ def require_github(func):
         if 'token' in session:
             return func(*a, **kw)
         else:
-            return redirect(url_for('login'))  # todo: add ?next=<current_url>
+            return redirect(url_for('.login'))  # todo: add ?next=<current_url>
     return wrapped
 
 
-@app.route('/login/')
+@bp.route('/login/')
 def login():
-    redirect_uri = url_for('authorized', next=request.args.get('next') or
+    redirect_uri = url_for('.authorized', next=request.args.get('next') or
                            request.referrer or None, _external=True)
     # More scopes http://developer.github.com/v3/oauth/#scopes
     params = {'redirect_uri': redirect_uri, 'scope': GITHUB_SCOPE}
     #print(github.get_authorize_url(**params))
-    return redirect(github.get_authorize_url(**params))
+    return redirect(get_state().oauth.get_authorize_url(**params))
 
 
-@app.route('/logout/')
+@bp.route('/logout/')
 def logout():
     del session['token']
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 
-@app.route('/callback/')
+@bp.route('/callback/')
 def authorized():
     ## check to make sure the user authorized the request
     if not 'code' in request.args:
         #flash('You did not authorize the request')
-        #return redirect(url_for('index'))
+        #return redirect(url_for('.index'))
         return "You did not authorize the request", 403
 
     ## make a request for the access token credentials using code
-    redirect_uri = url_for('authorized', _external=True)
+    redirect_uri = url_for('.authorized', _external=True)
 
     data = dict(
         code=request.args['code'],
@@ -86,8 +71,8 @@ def authorized():
         scope=GITHUB_SCOPE,
     )
 
-    auth = github.get_auth_session(data=data)
+    auth = get_state().oauth.get_auth_session(data=data)
 
     session['token'] = auth.access_token
 
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
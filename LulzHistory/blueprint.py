@@ -0,0 +1,7 @@
+"""
+The blueprint all the views are registered on
+"""
+
+from flask import Blueprint
+
+bp = Blueprint('lulz', __name__)
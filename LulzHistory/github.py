@@ -15,16 +15,7 @@ The purpose of this module is:
 
 import urlparse
 
-import requests
-from werkzeug.contrib.cache import SimpleCache
-
-from . import app
-
-
-CLIENT_ID = app.config['GITHUB_CLIENT_ID']
-CLIENT_SECRET = app.config['GITHUB_CLIENT_SECRET']
-cache = SimpleCache(default_timeout=600)
-aggressive_cache = SimpleCache(default_timeout=60)
+from .state import get_state
 
 
 class HTTPError(Exception):
@@ -57,9 +48,13 @@ def request(method, url, params=None, **kwargs):
         parsed = urlparse.parse_qs(params)
         #params = {k: v[0] for k, v in parsed.iteritems()}
         params = dict((k, v[0]) for k, v in parsed.iteritems())  # <2.7
-    params['client_id'] = CLIENT_ID
-    params['client_secret'] = CLIENT_SECRET
+    state = get_state()
+    params['client_id'] = state.client_id
+    params['client_secret'] = state.client_secret
 
+    ## Imported here, as it's quite slow to import and we don't
+    ## want to pay for it until we actually need to make requests
+    import requests
     response = requests.request(method, url, params=params, **kwargs)
 
     if not response.ok:
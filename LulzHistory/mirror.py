@@ -0,0 +1,324 @@
+##=============================================================================
+## Copyright 2013 Samuele Santi
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##     http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+##=============================================================================
+
+"""
+Local git mirrors backend.
+
+Keeps bare mirrors of repositories on local disk, refreshed with
+(incremental) ``git fetch``, and answers the same questions we'd
+ask to the GitHub API (commits, branches, files in the pictures
+repo) straight from the git object store.
+
+Results are shaped like the GitHub API ones, so that the views
+and templates can use them unchanged. Git only knows about author
+emails, so GitHub logins are found via the ``users.noreply`` emails
+or an explicit ``{email: login}`` map.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+STAMP_FILE_NAME = 'lulz-last-fetch'
+
+## Next to the mirror path, marks a failed clone
+FAILED_SUFFIX = '.failed'
+
+## Options for commands talking to the remote: as they run while
+## serving requests, give up on stalled transfers (so that we fall
+## back to the API instead of blocking forever)
+NETWORK_OPTIONS = ('-c', 'http.lowSpeedLimit=1000',
+                   '-c', 'http.lowSpeedTime=30')
+
+## Field / record separators for the ``git log`` output
+FS, RS = '\x1f', '\x1e'
+LOG_FIELDS = ('sha', 'author_name', 'author_email', 'author_time',
+              'committer_name', 'committer_email', 'committer_time',
+              'message')
+LOG_FORMAT = FS.join(('%H', '%an', '%ae', '%at', '%cn', '%ce', '%ct',
+                      '%B')) + RS
+
+noreply_email_re = re.compile(
+    r'^(?:[0-9]+\+)?([A-Za-z0-9-]+)@users\.noreply\.github\.com$')
+
+
+class MirrorError(Exception):
+    pass
+
+
+def _format_time(timestamp):
+    """Format a unix timestamp the way the GitHub API does"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(int(timestamp)))
+
+
+def gravatar_url(email):
+    """Avatar for authors we don't know the GitHub user of"""
+    digest = hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()
+    return 'https://secure.gravatar.com/avatar/{0}?d=identicon'.format(digest)
+
+
+class GitMirror(object):
+    """
+    Bare mirrors of GitHub repositories.
+
+    :param base_dir:
+        Directory where to keep the mirrors
+        (as ``<base_dir>/<owner>/<repo>.git``)
+
+    :param repos:
+        Names (``owner/repo``) of the repositories whose history
+        should be read from the mirrors
+
+    :param url_template:
+        Template for the URL to clone repositories from
+
+    :param refresh_interval:
+        Minimum number of seconds between fetches of the same
+        repository
+
+    :param authors:
+        Dictionary mapping author emails to GitHub logins
+    """
+
+    def __init__(self, base_dir, repos=(),
+                 url_template='https://github.com/{owner}/{repo}.git',
+                 refresh_interval=300, authors=None):
+        self.base_dir = base_dir
+        self.repos = frozenset(r.lower() for r in repos)
+        self.url_template = url_template
+        self.refresh_interval = refresh_interval
+        self.authors = dict((k.lower(), v)
+                            for k, v in (authors or {}).items())
+
+    def _git(self, *args, **kwargs):
+        """Run a git command, returning its output"""
+        cmd = ['git']
+        if kwargs.get('network'):
+            cmd.extend(NETWORK_OPTIONS)
+        if kwargs.get('git_dir') is not None:
+            cmd.extend(['--git-dir', kwargs['git_dir']])
+        cmd.extend(args)
+
+        ## Never ask for credentials (GitHub does that for
+        ## missing repositories..)
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, env=env)
+            out, err = proc.communicate()
+        except OSError as e:
+            raise MirrorError("Unable to run git: {0}".format(e))
+        if proc.returncode != 0:
+            raise MirrorError("git {0} failed: {1}".format(
+                args[0], err.decode('utf-8', 'replace').strip()))
+        return out.decode('utf-8', 'replace')
+
+    def is_mirrored(self, owner, repo):
+        """Whether history for this repository is read from a mirror"""
+        return '{0}/{1}'.format(owner, repo).lower() in self.repos
+
+    def get_path(self, owner, repo):
+        return os.path.join(self.base_dir, owner.lower(),
+                            '{0}.git'.format(repo.lower()))
+
+    def update(self, owner, repo, force=False):
+        """
+        Make sure the mirror exists and is up to date.
+
+        The first time, the repository is cloned; after that, it's
+        fetched again only if older than ``refresh_interval``
+        (unless ``force`` is true). If fetching fails, we keep
+        using what we already have.
+
+        If cloning or fetching fails (eg. the repository doesn't
+        exist, or the network is down), we don't try again until
+        ``refresh_interval`` has passed.
+
+        :raise MirrorError: if there is no usable mirror
+        :return: the path to the mirror
+        """
+        try:
+            return self._update(owner, repo, force)
+        except (IOError, OSError) as e:
+            ## Eg. the mirrors directory is missing or not writable
+            raise MirrorError("Unable to update mirror of {0}/{1}: {2}"
+                              "".format(owner, repo, e))
+
+    def _update(self, owner, repo, force):
+        path = self.get_path(owner, repo)
+        stamp = os.path.join(path, STAMP_FILE_NAME)
+
+        if not os.path.exists(stamp):
+            failed = path + FAILED_SUFFIX
+            if not force and os.path.exists(failed) and \
+                    time.time() - os.path.getmtime(failed) < \
+                    self.refresh_interval:
+                raise MirrorError("Cloning {0}/{1} failed recently"
+                                  "".format(owner, repo))
+            try:
+                self._clone(owner, repo, path)
+            except MirrorError:
+                open(failed, 'w').close()
+                os.utime(failed, None)
+                raise
+            if os.path.exists(failed):
+                os.unlink(failed)
+            return path
+
+        age = time.time() - os.path.getmtime(stamp)
+        if force or age >= self.refresh_interval:
+            try:
+                self._git('fetch', '--prune', '--quiet', 'origin',
+                          git_dir=path, network=True)
+            except MirrorError:
+                if force:
+                    raise
+            ## Even if fetching failed: we'll use what we have
+            ## until it's time to try again
+            os.utime(stamp, None)
+
+        return path
+
+    def _clone(self, owner, repo, path):
+        ## Clone to a temporary directory, then move in place,
+        ## to avoid leaving broken repositories around (or other
+        ## processes finding half-cloned ones)
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not os.path.isdir(parent):
+                    raise
+
+        url = self.url_template.format(owner=owner, repo=repo)
+        tmpdir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+        try:
+            tmppath = os.path.join(tmpdir, 'repo.git')
+            ## We never look at file contents (only at commits and
+            ## file names), so we don't need to download blobs
+            self._git('clone', '--bare', '--quiet', '--filter=blob:none',
+                      url, tmppath, network=True)
+
+            ## Bare clones don't have a fetch refspec
+            self._git('config', 'remote.origin.fetch',
+                      '+refs/heads/*:refs/heads/*', git_dir=tmppath)
+            open(os.path.join(tmppath, STAMP_FILE_NAME), 'w').close()
+
+            if os.path.exists(path):
+                ## Somebody else was faster (or we are replacing a
+                ## mirror without stamp, that is, a broken one)
+                if os.path.exists(os.path.join(path, STAMP_FILE_NAME)):
+                    return
+                shutil.rmtree(path)
+            os.rename(tmppath, path)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def update_all(self):
+        """Update mirrors for all the configured repositories"""
+        for name in sorted(self.repos):
+            owner, repo = name.split('/', 1)
+            self.update(owner, repo, force=True)
+
+    def get_author(self, email):
+        """
+        Get a GitHub-like author object from an email,
+        or ``None`` if we don't know the user.
+        """
+        email = email.lower()
+        login = self.authors.get(email)
+        if login is None:
+            match = noreply_email_re.match(email)
+            if match is None:
+                return None
+            login = match.group(1)
+        return {
+            'login': login,
+            'html_url': 'https://github.com/{0}'.format(login),
+            'avatar_url': 'https://github.com/{0}.png'.format(login),
+        }
+
+    def get_commits(self, owner, repo, branch=None, limit=100):
+        """
+        List the latest commits on a branch (the default one if
+        ``branch`` is None), GitHub API style.
+        """
+        path = self.update(owner, repo)
+        ref = 'HEAD' if branch is None else 'refs/heads/{0}'.format(branch)
+        out = self._git('log', '--max-count={0}'.format(limit),
+                        '--format=' + LOG_FORMAT, ref, '--',
+                        git_dir=path)
+
+        commits = []
+        for record in out.split(RS):
+            record = record.strip('\n')
+            if not record:
+                continue
+            c = dict(zip(LOG_FIELDS, record.split(FS)))
+            commits.append({
+                'sha': c['sha'],
+                'html_url': 'https://github.com/{0}/{1}/commit/{2}'
+                            ''.format(owner, repo, c['sha']),
+                'author': self.get_author(c['author_email']),
+                'committer': self.get_author(c['committer_email']),
+                'commit': {
+                    'message': c['message'].strip(),
+                    'author': {
+                        'name': c['author_name'],
+                        'email': c['author_email'],
+                        'date': _format_time(c['author_time']),
+                    },
+                    'committer': {
+                        'name': c['committer_name'],
+                        'email': c['committer_email'],
+                        'date': _format_time(c['committer_time']),
+                    },
+                },
+            })
+        return commits
+
+    def list_branches(self, owner, repo):
+        """List the branches, GitHub API style"""
+        path = self.update(owner, repo)
+        out = self._git('for-each-ref', '--format=%(objectname) %(refname)',
+                        'refs/heads/', git_dir=path)
+        branches = []
+        for line in out.splitlines():
+            sha, ref = line.split(' ', 1)
+            branches.append({
+                'name': ref[len('refs/heads/'):],
+                'commit': {'sha': sha},
+            })
+        return branches
+
+    def get_default_branch(self, owner, repo):
+        path = self.update(owner, repo)
+        ref = self._git('symbolic-ref', 'HEAD', git_dir=path).strip()
+        return ref[len('refs/heads/'):]
+
+    def list_files(self, owner, repo, branch=None):
+        """List paths of all the files in a branch"""
+        path = self.update(owner, repo)
+        ref = 'HEAD' if branch is None else 'refs/heads/{0}'.format(branch)
+        out = self._git('ls-tree', '-r', '-z', '--name-only', ref,
+                        git_dir=path)
+        return [name for name in out.split('\0') if name]
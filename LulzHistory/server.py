@@ -16,7 +16,8 @@
 
 
 def run(*args, **kwargs):
-    from LulzHistory import app
+    from LulzHistory import create_app
+    app = create_app()
     app.run(*args, **kwargs)
 
 
@@ -34,5 +35,46 @@ def run_from_command_line():
         debug=opts.debug)
 
 
+def build_assets_from_command_line():
+    import optparse
+    parser = optparse.OptionParser(
+        description="Build fingerprinted and precompressed static assets. "
+        "The output directory defaults to the ASSETS_DIR configured "
+        "in the LULZ_CONF file. Running servers pick up the new "
+        "manifest without restarting. Old hashed files are kept: "
+        "empty the output directory first to remove them.")
+    parser.add_option('--output', action='store', dest='output',
+                      default=None)
+    opts, args = parser.parse_args()
+
+    from LulzHistory.assets import build_assets
+    output = opts.output
+    if output is None:
+        import os
+        from flask import Config
+        from LulzHistory import create_app
+        config = Config(os.getcwd())
+        config.from_envvar('LULZ_CONF')
+        config['ASSETS_BUILD'] = False  # We are going to, right below
+        output = create_app(config).config['ASSETS_DIR']
+    manifest = build_assets(output)
+    print("Built {0} assets in {1}".format(len(manifest), output))
+
+
+def update_mirrors_from_command_line():
+    import optparse
+    parser = optparse.OptionParser(
+        description="Create / update the local git mirrors of the "
+        "repositories listed in GIT_MIRROR_REPOS (in the LULZ_CONF file).")
+    parser.parse_args()
+
+    from LulzHistory import create_app
+    from LulzHistory.state import get_state
+    mirror = get_state(create_app()).git_mirror
+    if mirror is None:
+        raise SystemExit("GIT_MIRROR_DIR is not configured")
+    mirror.update_all()
+
+
 if __name__ == '__main__':
     run_from_command_line()
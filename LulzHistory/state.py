@@ -0,0 +1,133 @@
+##=============================================================================
+## Copyright 2013 Samuele Santi
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##     http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+##=============================================================================
+
+"""
+Per-application shared objects.
+
+Everything in here used to be created as a side effect of importing
+the views; now it is built the first time it's needed (or all at
+once, by :py:meth:`AppState.preload`, before forking workers).
+"""
+
+import re
+
+from flask import current_app
+from werkzeug.utils import cached_property
+
+
+EXTENSION_NAME = 'lulz_history'
+
+#GITHUB_SCOPE = 'user:email,repo'
+GITHUB_SCOPE = ''
+
+
+class AppState(object):
+    """
+    Lazily-built objects bound to an application configuration.
+
+    :param config:
+        The Flask configuration the objects are built from
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    @cached_property
+    def client_id(self):
+        return self.config['GITHUB_CLIENT_ID']
+
+    @cached_property
+    def client_secret(self):
+        return self.config['GITHUB_CLIENT_SECRET']
+
+    @cached_property
+    def oauth(self):
+        """OAuth2 service used for the GitHub login flow"""
+        from rauth.service import OAuth2Service
+        return OAuth2Service(
+            name='github',
+            base_url='https://api.github.com/',
+            access_token_url='https://github.com/login/oauth/access_token',
+            authorize_url='https://github.com/login/oauth/authorize',
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+        )
+
+    @cached_property
+    def cache(self):
+        """Cache used by the views"""
+        from werkzeug.contrib.cache import SimpleCache
+        return SimpleCache(default_timeout=120)
+
+    @cached_property
+    def img_file_re(self):
+        """Regexp for image files in the pictures repository"""
+        return re.compile(r'^[0-9a-f]{10,40}\.(jpg|gif|png)$')
+
+    @cached_property
+    def assets_dir(self):
+        return self.config['ASSETS_DIR']
+
+    @cached_property
+    def assets_manifest(self):
+        """Map of static file names to their hashed versions"""
+        from .assets import Manifest
+        return Manifest(self.assets_dir)
+
+    @cached_property
+    def git_mirror(self):
+        """Local git mirrors backend, if enabled (else ``None``)"""
+        if not self.config.get('GIT_MIRROR_DIR'):
+            return None
+        from .mirror import GitMirror
+        kwargs = {}
+        if self.config.get('GIT_MIRROR_URL'):
+            kwargs['url_template'] = self.config['GIT_MIRROR_URL']
+        return GitMirror(
+            self.config['GIT_MIRROR_DIR'],
+            repos=self.config.get('GIT_MIRROR_REPOS', ()),
+            refresh_interval=self.config.get('GIT_MIRROR_REFRESH', 300),
+            authors=self.config.get('GIT_MIRROR_AUTHORS'),
+            **kwargs)
+
+    def preload(self):
+        """
+        Build all the shared objects right away.
+
+        Meant to be called in the master process of a pre-forking
+        server, so that workers inherit the already imported modules
+        and built objects (sharing their memory pages until they are
+        written to) instead of each building its own copy.
+        """
+        ## Make sure the (slow to import) HTTP libraries are loaded too
+        import requests  # noqa
+        for name in ('client_id', 'client_secret', 'oauth', 'cache',
+                     'img_file_re', 'assets_dir', 'assets_manifest',
+                     'git_mirror'):
+            getattr(self, name)
+        return self
+
+
+def get_state(app=None):
+    """
+    Get the :py:class:`AppState` for an application.
+
+    :param app:
+        The Flask application; defaults to the current one
+    """
+    if app is None:
+        app = current_app
+    return app.extensions[EXTENSION_NAME]
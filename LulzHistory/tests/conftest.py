@@ -0,0 +1,15 @@
+"""
+Fixtures shared by the tests
+"""
+
+import pytest
+
+
+@pytest.fixture
+def app_config():
+    """Minimal configuration to create an application"""
+    return {
+        'SECRET_KEY': 'secret',
+        'GITHUB_CLIENT_ID': 'my-client-id',
+        'GITHUB_CLIENT_SECRET': 'my-client-secret',
+    }
@@ -0,0 +1,89 @@
+"""
+Tests for the application factory
+"""
+
+import os
+import subprocess
+import sys
+
+import mock
+
+
+def test_import_has_no_side_effects():
+    ## Importing the package must not need configuration,
+    ## nor load the views / HTTP libraries
+    env = dict(os.environ)
+    env.pop('LULZ_CONF', None)
+    code = ("import sys, LulzHistory; "
+            "assert 'LulzHistory.views' not in sys.modules; "
+            "assert 'requests' not in sys.modules; "
+            "assert 'rauth' not in sys.modules")
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+
+
+def test_create_app_from_dict(app_config):
+    from LulzHistory import create_app
+    from LulzHistory.state import get_state
+
+    app = create_app(app_config)
+    assert app.config['GITHUB_CLIENT_ID'] == 'my-client-id'
+
+    state = get_state(app)
+    assert 'oauth' not in state.__dict__  # Built lazily
+    assert state.oauth.client_id == 'my-client-id'
+    assert 'oauth' in state.__dict__
+
+
+def test_create_app_from_file(app_config, tmpdir):
+    from LulzHistory import create_app
+
+    config_file = tmpdir.join('lulz.cfg')
+    config_file.write(''.join('{0} = {1!r}\n'.format(key, value)
+                              for key, value in app_config.iteritems()))
+    app = create_app(str(config_file))
+    assert app.config['GITHUB_CLIENT_SECRET'] == 'my-client-secret'
+
+
+def test_create_app_preload(app_config):
+    from LulzHistory import create_app
+    from LulzHistory.state import get_state
+
+    app = create_app(app_config, preload=True)
+    state = get_state(app)
+    for name in ('oauth', 'cache', 'img_file_re'):
+        assert name in state.__dict__
+
+
+def test_apps_do_not_share_state(app_config):
+    from LulzHistory import create_app
+    from LulzHistory.state import get_state
+
+    app1 = create_app(app_config)
+    app2 = create_app(dict(app_config, GITHUB_CLIENT_ID='other-id'))
+    assert get_state(app1).cache is not get_state(app2).cache
+    assert get_state(app2).client_id == 'other-id'
+
+
+def test_login_redirects_to_github(app_config):
+    from LulzHistory import create_app
+
+    app = create_app(app_config)
+    client = app.test_client()
+    resp = client.get('/login/')
+    assert resp.status_code == 302
+    assert resp.location.startswith(
+        'https://github.com/login/oauth/authorize')
+    assert 'client_id=my-client-id' in resp.location
+
+
+def test_api_request_uses_app_credentials(app_config):
+    from LulzHistory import create_app
+    from LulzHistory import github
+
+    app = create_app(app_config)
+    with app.app_context():
+        with mock.patch('requests.request') as fake_request:
+            github.request('GET', '/users/octocat')
+    params = fake_request.call_args[1]['params']
+    assert params['client_id'] == 'my-client-id'
+    assert params['client_secret'] == 'my-client-secret'
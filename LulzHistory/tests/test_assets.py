@@ -0,0 +1,201 @@
+"""
+Tests for the static assets pipeline
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+
+import mock
+import pytest
+
+
+@pytest.fixture
+def tmpdirs(tmpdir):
+    static_dir = str(tmpdir.mkdir('static'))
+    output_dir = str(tmpdir.mkdir('assets'))
+
+    files = {
+        'style.css': "body {\n    color: red;\n}\n" * 50,
+        'css/fonts.css': "@font-face { src: url('../font/icons.woff?v=1'); }"
+                         "\n.logo { background: url(data:image/png;base64,"
+                         "AAAA); }\n",
+        'font/icons.woff': "not really a font",
+        'lib.min.js': "var a=1;",
+    }
+    for name, content in files.iteritems():
+        path = os.path.join(static_dir, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+    return static_dir, output_dir
+
+
+def read(*parts):
+    with open(os.path.join(*parts), 'rb') as f:
+        return f.read()
+
+
+def test_build_assets(tmpdirs):
+    from LulzHistory.assets import build_assets, load_manifest
+    static_dir, output_dir = tmpdirs
+
+    manifest = build_assets(output_dir, static_dir=static_dir)
+    assert sorted(manifest) == [
+        'css/fonts.css', 'font/icons.woff', 'lib.min.js', 'style.css']
+    assert load_manifest(output_dir) == manifest
+    with open(os.path.join(output_dir, 'manifest.json')) as f:
+        assert json.load(f) == manifest
+
+    hashed = manifest['style.css']
+    assert hashed.startswith('style.') and hashed.endswith('.css')
+    assert hashed != 'style.css'
+
+    ## Precompressed variant, only for compressible files
+    content = read(output_dir, hashed)
+    gzipped = read(output_dir, hashed + '.gz')
+    assert gzip.GzipFile(fileobj=io.BytesIO(gzipped)).read() == content
+    assert not os.path.exists(
+        os.path.join(output_dir, manifest['font/icons.woff'] + '.gz'))
+
+    ## References in stylesheets point to the hashed files
+    fonts_css = read(output_dir, manifest['css/fonts.css'])
+    font_name = manifest['font/icons.woff'].split('/')[-1]
+    assert "url('../font/{0}?v=1')".format(font_name) in fonts_css
+    assert "url(data:image/png;base64,AAAA)" in fonts_css
+
+
+def test_build_assets_hash_changes_with_content(tmpdirs):
+    from LulzHistory.assets import build_assets
+    static_dir, output_dir = tmpdirs
+
+    manifest1 = build_assets(output_dir, static_dir=static_dir)
+    assert build_assets(output_dir, static_dir=static_dir) == manifest1
+
+    with open(os.path.join(static_dir, 'font', 'icons.woff'), 'wb') as f:
+        f.write("a different font")
+    manifest2 = build_assets(output_dir, static_dir=static_dir)
+
+    assert manifest2['style.css'] == manifest1['style.css']
+    assert manifest2['font/icons.woff'] != manifest1['font/icons.woff']
+    ## The stylesheet referencing the font changed too
+    assert manifest2['css/fonts.css'] != manifest1['css/fonts.css']
+
+
+def test_build_assets_hash_is_of_final_content(tmpdirs):
+    from LulzHistory import assets
+    static_dir, output_dir = tmpdirs
+
+    with mock.patch.object(assets, '_minify',
+                           side_effect=lambda c, ext: c.replace(' ', '')):
+        manifest = assets.build_assets(output_dir, static_dir=static_dir)
+
+    content = read(output_dir, manifest['style.css'])
+    assert ' ' not in content
+    digest = hashlib.md5(content).hexdigest()[:12]
+    assert manifest['style.css'] == 'style.{0}.css'.format(digest)
+
+
+def test_load_missing_manifest(tmpdirs):
+    from LulzHistory.assets import load_manifest
+    static_dir, output_dir = tmpdirs
+    assert load_manifest(os.path.join(output_dir, 'missing')) == {}
+
+
+@pytest.fixture
+def app(tmpdirs, app_config):
+    from LulzHistory import create_app
+    from LulzHistory.assets import build_assets
+    static_dir, output_dir = tmpdirs
+    build_assets(output_dir, static_dir=static_dir)
+    return create_app(dict(app_config, ASSETS_DIR=output_dir))
+
+
+def test_asset_url(app):
+    from LulzHistory.state import get_state
+    manifest = get_state(app).assets_manifest
+    with app.test_request_context():
+        from flask import render_template_string
+        assert render_template_string("{{ asset_url('style.css') }}") == \
+            '/assets/' + manifest.get('style.css')
+        ## Not in the manifest: use the default static handler
+        assert render_template_string("{{ asset_url('other.css') }}") == \
+            '/static/other.css'
+
+
+def test_serve_asset(app):
+    from LulzHistory.state import get_state
+    state = get_state(app)
+    hashed = state.assets_manifest.get('style.css')
+    client = app.test_client()
+
+    resp = client.get('/assets/' + hashed)
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/css'
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.data == read(state.assets_dir, hashed)
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+    resp = client.get('/assets/' + hashed,
+                      headers={'Accept-Encoding': 'gzip, deflate'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/css'
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.data == read(state.assets_dir, hashed + '.gz')
+    assert 'immutable' in resp.headers['Cache-Control']
+
+
+def test_serve_asset_not_found(app):
+    from LulzHistory.state import get_state
+    hashed = get_state(app).assets_manifest.get('style.css')
+    client = app.test_client()
+    assert client.get('/assets/style.css').status_code == 404
+    assert client.get('/assets/manifest.json').status_code == 404
+    assert client.get('/assets/' + hashed + '.gz').status_code == 404
+    assert client.get('/assets/style.0123456789ab.css').status_code == 404
+    assert client.get('/assets/../style.0123456789ab.css').status_code == \
+        404
+
+
+def test_manifest_reload(app, tmpdirs):
+    from LulzHistory.assets import build_assets
+    from LulzHistory.state import get_state
+    static_dir, output_dir = tmpdirs
+    manifest = get_state(app).assets_manifest
+    old_hashed = manifest.get('style.css')
+
+    with open(os.path.join(static_dir, 'style.css'), 'wb') as f:
+        f.write("body { color: blue; }\n")
+    build_assets(output_dir, static_dir=static_dir)
+    ## Make sure the mtime changes, even on coarse-grained filesystems
+    manifest_file = os.path.join(output_dir, 'manifest.json')
+    mtime = os.path.getmtime(manifest_file) + 10
+    os.utime(manifest_file, (mtime, mtime))
+
+    new_hashed = manifest.get('style.css')
+    assert new_hashed != old_hashed
+
+    ## Files from the previous build are still served
+    client = app.test_client()
+    assert client.get('/assets/' + new_hashed).status_code == 200
+    resp = client.get('/assets/' + old_hashed)
+    assert resp.status_code == 200
+    assert 'red' in resp.data
+
+
+def test_build_failure_falls_back_to_static(tmpdir, app_config):
+    from LulzHistory import create_app
+
+    ## A file where the assets directory should be
+    assets_dir = tmpdir.join('assets')
+    assets_dir.write('not a directory')
+    app = create_app(dict(app_config, ASSETS_BUILD=True,
+                          ASSETS_DIR=str(assets_dir.join('sub'))))
+    with app.test_request_context():
+        from flask import render_template_string
+        assert render_template_string("{{ asset_url('style.css') }}") == \
+            '/static/style.css'
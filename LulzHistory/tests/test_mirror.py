@@ -0,0 +1,434 @@
+"""
+Tests for the local git mirrors backend
+"""
+
+import os
+import subprocess
+import time
+
+import mock
+import pytest
+
+
+def git(cwd, *args):
+    return subprocess.check_output(
+        ['git', '-c', 'user.name=Committer',
+         '-c', 'user.email=committer@example.com'] + list(args),
+        cwd=cwd)
+
+
+def commit(workdir, path, content, author, message):
+    filename = os.path.join(workdir, *path.split('/'))
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, 'w') as f:
+        f.write(content)
+    git(workdir, 'add', path)
+    git(workdir, 'commit', '--quiet', '--author', author, '-m', message)
+    git(workdir, 'push', '--quiet', 'origin', 'HEAD')
+    return git(workdir, 'rev-parse', 'HEAD').decode('ascii').strip()
+
+
+@pytest.fixture
+def remotes(tmpdir):
+    """
+    A directory with "remote" bare repositories, named like
+    ``<owner>/<repo>.git``, with working copies to push from.
+    """
+    base = str(tmpdir)
+
+    def create(owner, repo):
+        remote = os.path.join(base, 'remotes', owner, repo + '.git')
+        workdir = os.path.join(base, 'work', owner, repo)
+        os.makedirs(remote)
+        os.makedirs(workdir)
+        git(remote, 'init', '--quiet', '--bare')
+        git(remote, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+        git(workdir, 'init', '--quiet')
+        git(workdir, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+        git(workdir, 'remote', 'add', 'origin', remote)
+        return workdir
+
+    create.base = base
+    create.url_template = os.path.join(
+        base, 'remotes', '{owner}', '{repo}.git')
+    return create
+
+
+@pytest.fixture
+def mirror(remotes):
+    from LulzHistory.mirror import GitMirror
+    return GitMirror(
+        os.path.join(remotes.base, 'mirrors'),
+        repos=['Alice/Project'],
+        url_template=remotes.url_template,
+        refresh_interval=3600,
+        authors={'Alice@Example.com': 'alice'})
+
+
+def test_get_commits(remotes, mirror):
+    workdir = remotes('alice', 'project')
+    sha1 = commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+                  'First commit')
+    sha2 = commit(workdir, 'README', 'Hello!',
+                  'Bob <123+bob@users.noreply.github.com>',
+                  'Second commit\n\nWith a longer description')
+    sha3 = commit(workdir, 'README', 'Hello!!', 'Eve <eve@example.com>',
+                  'Third commit')
+
+    assert mirror.is_mirrored('alice', 'project')
+    assert not mirror.is_mirrored('alice', 'other')
+
+    commits = mirror.get_commits('alice', 'project')
+    assert [c['sha'] for c in commits] == [sha3, sha2, sha1]
+
+    assert commits[2]['commit']['message'] == 'First commit'
+    assert commits[1]['commit']['message'] == \
+        'Second commit\n\nWith a longer description'
+    assert commits[2]['commit']['author']['email'] == 'alice@example.com'
+    assert commits[2]['commit']['author']['date'].endswith('Z')
+    assert commits[2]['html_url'] == \
+        'https://github.com/alice/project/commit/' + sha1
+
+    ## Authors, as known from the map or GitHub "noreply" emails
+    assert commits[2]['author']['login'] == 'alice'
+    assert commits[2]['author']['html_url'] == 'https://github.com/alice'
+    assert commits[1]['author']['login'] == 'bob'
+    assert commits[0]['author'] is None
+
+    assert len(mirror.get_commits('alice', 'project', limit=2)) == 2
+
+
+def test_branches(remotes, mirror):
+    workdir = remotes('alice', 'project')
+    sha1 = commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+                  'First commit')
+    git(workdir, 'checkout', '--quiet', '-b', 'feature')
+    sha2 = commit(workdir, 'feature.txt', 'New', 'Alice <alice@example.com>',
+                  'New feature')
+    git(workdir, 'push', '--quiet', 'origin', 'feature')
+
+    branches = mirror.list_branches('alice', 'project')
+    assert sorted((b['name'], b['commit']['sha']) for b in branches) == [
+        ('feature', sha2), ('master', sha1)]
+    assert mirror.get_default_branch('alice', 'project') == 'master'
+
+    assert [c['sha'] for c in
+            mirror.get_commits('alice', 'project', branch='feature')] == \
+        [sha2, sha1]
+    assert [c['sha'] for c in mirror.get_commits('alice', 'project')] == \
+        [sha1]
+
+
+def test_list_files(remotes, mirror):
+    workdir = remotes('alice', 'my-lulz-pics')
+    commit(workdir, 'project/0123456789.jpg', 'picture',
+           'Alice <alice@example.com>', 'A picture')
+    commit(workdir, 'abcdef0123.png', 'picture',
+           'Alice <alice@example.com>', 'Another picture')
+
+    assert sorted(mirror.list_files('alice', 'my-lulz-pics')) == [
+        'abcdef0123.png', 'project/0123456789.jpg']
+
+
+def test_refresh(remotes, mirror):
+    workdir = remotes('alice', 'project')
+    sha1 = commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+                  'First commit')
+    assert [c['sha'] for c in mirror.get_commits('alice', 'project')] == \
+        [sha1]
+
+    sha2 = commit(workdir, 'README', 'Hello!', 'Alice <alice@example.com>',
+                  'Second commit')
+
+    ## Not refreshed until refresh_interval passed..
+    assert [c['sha'] for c in mirror.get_commits('alice', 'project')] == \
+        [sha1]
+
+    mirror.update('alice', 'project', force=True)
+    assert [c['sha'] for c in mirror.get_commits('alice', 'project')] == \
+        [sha2, sha1]
+
+    ## ..unless the interval is zero
+    sha3 = commit(workdir, 'README', 'Hello!!', 'Alice <alice@example.com>',
+                  'Third commit')
+    mirror.refresh_interval = 0
+    assert [c['sha'] for c in mirror.get_commits('alice', 'project')] == \
+        [sha3, sha2, sha1]
+
+
+def test_update_all(remotes, mirror):
+    workdir = remotes('alice', 'project')
+    commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+           'First commit')
+    mirror.update_all()
+    assert os.path.exists(mirror.get_path('alice', 'project'))
+
+
+def test_missing_repo(remotes, mirror):
+    from LulzHistory.mirror import MirrorError
+    with pytest.raises(MirrorError):
+        mirror.list_files('nobody', 'my-lulz-pics')
+    assert not os.path.exists(mirror.get_path('nobody', 'my-lulz-pics'))
+
+
+def test_failed_clone_not_retried(remotes, mirror):
+    from LulzHistory.mirror import MirrorError
+    with pytest.raises(MirrorError):
+        mirror.update('alice', 'project')
+
+    ## The repository appears, but we don't try again so soon..
+    workdir = remotes('alice', 'project')
+    sha = commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+                 'First commit')
+    with pytest.raises(MirrorError) as excinfo:
+        mirror.update('alice', 'project')
+    assert 'failed recently' in str(excinfo.value)
+
+    ## ..unless the interval passed
+    mirror.refresh_interval = 0
+    assert [c['sha'] for c in mirror.get_commits('alice', 'project')] == \
+        [sha]
+    assert not os.path.exists(
+        mirror.get_path('alice', 'project') + '.failed')
+
+
+def test_failed_fetch_not_retried(remotes, mirror):
+    workdir = remotes('alice', 'project')
+    sha = commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+                 'First commit')
+    path = mirror.update('alice', 'project')
+
+    ## The remote goes away, and it's time to refresh
+    os.rename(os.path.join(remotes.base, 'remotes', 'alice'),
+              os.path.join(remotes.base, 'remotes', 'gone'))
+    stamp = os.path.join(path, 'lulz-last-fetch')
+    os.utime(stamp, (time.time() - 7200, time.time() - 7200))
+
+    with mock.patch.object(mirror, '_git', wraps=mirror._git) as git_cmd:
+        for _ in range(3):
+            ## Stale data is better than nothing
+            assert [b['commit']['sha'] for b in
+                    mirror.list_branches('alice', 'project')] == [sha]
+    fetches = [c for c in git_cmd.call_args_list if c[0][0] == 'fetch']
+    assert len(fetches) == 1
+
+
+def test_mirror_dir_not_writable(remotes, tmpdir):
+    from LulzHistory.mirror import GitMirror, MirrorError
+    remotes('alice', 'project')
+
+    ## A file where the mirrors directory should be
+    base_dir = tmpdir.join('mirrors')
+    base_dir.write('not a directory')
+    mirror = GitMirror(str(base_dir.join('sub')),
+                       url_template=remotes.url_template)
+    with pytest.raises(MirrorError):
+        mirror.update('alice', 'project')
+    with pytest.raises(MirrorError):
+        mirror.list_files('alice', 'project')
+
+
+def test_clone_without_blobs(remotes, mirror):
+    workdir = remotes('alice', 'project')
+    commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+           'First commit')
+    remote = os.path.join(remotes.base, 'remotes', 'alice', 'project.git')
+    git(remote, 'config', 'uploadpack.allowFilter', 'true')
+    mirror.url_template = 'file://' + remotes.url_template
+
+    assert mirror.list_files('alice', 'project') == ['README']
+    assert len(mirror.get_commits('alice', 'project')) == 1
+    missing = git(mirror.get_path('alice', 'project'), 'rev-list',
+                  '--objects', '--missing=print', '--all')
+    assert [l for l in missing.decode('ascii').splitlines()
+            if l.startswith('?')]  # The README blob
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.data = data
+        self.links = {}
+
+    def json(self):
+        return self.data
+
+
+def fake_api(responses):
+    """
+    Replace ``github.request`` with a function returning the
+    data in ``responses`` (by URL), or raising HTTPError (404).
+    """
+    from LulzHistory.github import HTTPError
+
+    def request(method, url, params=None):
+        if url not in responses:
+            raise HTTPError(404, 'Not Found')
+        return FakeResponse(responses[url])
+    return mock.patch('LulzHistory.github.request', side_effect=request)
+
+
+def make_app(remotes, app_config, **kwargs):
+    from LulzHistory import create_app
+    config = dict(
+        app_config,
+        GIT_MIRROR_DIR=os.path.join(remotes.base, 'mirrors'),
+        GIT_MIRROR_URL=remotes.url_template,
+        GIT_MIRROR_REPOS=['alice/project'],
+        GIT_MIRROR_AUTHORS={'alice@example.com': 'alice'})
+    config.update(kwargs)
+    return create_app(config)
+
+
+def test_views_use_mirror(remotes, app_config):
+    from LulzHistory import views
+
+    workdir = remotes('alice', 'project')
+    sha = commit(workdir, 'README', 'Hello', 'Alice <alice@example.com>',
+                 'First commit')
+    pics = remotes('alice', 'my-lulz-pics')
+    commit(pics, 'project/{0}.jpg'.format(sha[:10]), 'picture',
+           'Alice <alice@example.com>', 'A picture')
+
+    app = make_app(remotes, app_config)
+    with app.app_context(), fake_api({}) as api_request:
+        commits = views.get_commits(owner='alice', repo='project',
+                                    branch=None)
+        assert [c['sha'] for c in commits] == [sha]
+        assert [b['name'] for b in
+                views.list_branches(owner='alice', repo='project')] == \
+            ['master']
+        assert views.get_repo_pics(owner='alice', repo='my-lulz-pics') == {
+            sha[:10]: 'https://raw.github.com/alice/my-lulz-pics/master/'
+                      'project/{0}.jpg'.format(sha[:10])}
+        assert api_request.call_count == 0
+
+        ## No pictures repo to mirror: ask the API
+        assert views.get_repo_pics(owner='bob', repo='my-lulz-pics') == {}
+        api_request.assert_called_once_with(
+            'GET', '/repos/bob/my-lulz-pics/contents')
+
+
+def test_views_fall_back_to_api(remotes, app_config):
+    ## The mirror can't be cloned: everything comes from the API
+    app = make_app(remotes, app_config,
+                   GIT_MIRROR_REPOS=['alice/gone'],
+                   GIT_MIRROR_URL=os.path.join(
+                       remotes.base, 'nowhere', '{owner}', '{repo}.git'))
+    author = {'login': 'alice', 'html_url': 'https://github.com/alice',
+              'avatar_url': 'https://example.com/alice.png'}
+    responses = {
+        '/repos/alice/gone/commits': [{
+            'sha': '0123456789abcdef',
+            'html_url': 'https://github.com/alice/gone/commit/0123456789',
+            'author': author,
+            'commit': {'message': 'Hello',
+                       'author': {'name': 'Alice', 'email': 'a@example.com',
+                                  'date': '2013-12-23T10:00:00Z'}},
+        }],
+        '/repos/alice/gone/branches': [{'name': 'master'}],
+        '/repos/alice/my-lulz-pics/contents': [{
+            'type': 'file', 'name': '0123456789.jpg',
+            'path': '0123456789.jpg'}],
+    }
+    client = app.test_client()
+    with fake_api(responses):
+        resp = client.get('/repo/alice/gone/commits')
+        assert resp.status_code == 200
+        assert 'raw.github.com/alice/my-lulz-pics/master/0123456789.jpg' \
+            in resp.data
+
+        resp = client.get('/repo/alice/gone/')
+        assert resp.status_code == 200
+
+
+def test_unknown_authors_from_api(remotes, app_config):
+    from LulzHistory import views
+
+    workdir = remotes('alice', 'project')
+    commit(workdir, 'README', 'Hello', 'Eve <eve@example.com>', 'First')
+    sha2 = commit(workdir, 'README', 'Hello!', 'Eve <eve@example.com>',
+                  'Second')
+    commit(workdir, 'README', 'Hello!!', 'Mallory <mallory@example.com>',
+           'Third')
+    sha4 = commit(workdir, 'README', 'Hello!!!',
+                  'Mallory <mallory@example.com>', 'Fourth')
+
+    eve = {'login': 'eve', 'html_url': 'https://github.com/eve',
+           'avatar_url': 'https://example.com/eve.png'}
+    responses = {
+        ## Only asked once per author, about their latest commit
+        '/repos/alice/project/commits/' + sha2: {'author': eve},
+        '/repos/alice/project/commits/' + sha4: {'author': None},
+    }
+    app = make_app(remotes, app_config)
+    with fake_api(responses) as api_request:
+        with app.app_context():
+            commits = views.get_commits(owner='alice', repo='project',
+                                        branch=None)
+        assert api_request.call_count == 2
+        assert [c['author'] and c['author']['login'] for c in commits] == \
+            [None, None, 'eve', 'eve']
+
+        ## Not GitHub users are shown by name
+        resp = app.test_client().get('/repo/alice/project/commits')
+        assert resp.status_code == 200
+        assert 'Mallory' in resp.data
+        assert 'https://github.com/eve' in resp.data
+        ## Only eve's pictures repo is looked up (not mirrored,
+        ## so via the API)
+        assert api_request.call_count == 3
+
+
+def test_views_with_mirror_dir_not_writable(remotes, app_config, tmpdir):
+    from LulzHistory import views
+
+    base_dir = tmpdir.join('mirrors')
+    base_dir.write('not a directory')
+    app = make_app(remotes, app_config,
+                   GIT_MIRROR_DIR=str(base_dir.join('sub')))
+    author = {'login': 'alice', 'html_url': 'https://github.com/alice',
+              'avatar_url': 'https://example.com/alice.png'}
+    responses = {
+        '/repos/alice/project/commits': [{
+            'sha': '0123456789abcdef',
+            'html_url': 'https://github.com/alice/project/commit/01234',
+            'author': author,
+            'commit': {'message': 'Hello',
+                       'author': {'name': 'Alice', 'email': 'a@example.com',
+                                  'date': '2013-12-23T10:00:00Z'}},
+        }],
+        '/repos/alice/my-lulz-pics/contents': [{
+            'type': 'file', 'name': '0123456789.jpg',
+            'path': '0123456789.jpg'}],
+    }
+    with fake_api(responses):
+        with app.app_context():
+            assert views.get_repo_pics(owner='alice',
+                                       repo='my-lulz-pics') == {
+                '0123456789': 'https://raw.github.com/alice/my-lulz-pics/'
+                              'master/0123456789.jpg'}
+        resp = app.test_client().get('/repo/alice/project/commits')
+        assert resp.status_code == 200
+
+
+def test_author_lookup_failure(remotes, app_config):
+    from LulzHistory import views
+
+    workdir = remotes('alice', 'project')
+    for i in range(5):
+        sha = commit(workdir, 'README', 'Hello' * i, 'Eve <eve@example.com>',
+                     'Commit #{0}'.format(i))
+
+    app = make_app(remotes, app_config)
+    with fake_api({}) as api_request:  # Every request fails
+        with app.app_context():
+            commits = views.get_commits(owner='alice', repo='project',
+                                        branch=None)
+            assert [c['author'] for c in commits] == [None] * 5
+            assert api_request.call_count == 1
+
+            ## The failure is cached for a while
+            assert views.get_commit_author(
+                'alice', 'project', sha, 'eve@example.com') is None
+            assert api_request.call_count == 1
@@ -77,8 +77,33 @@ def test_function_cache():
         assert calls['myfunc'] == 8
 
 
+def test_function_cache_lazy():
+    ## the cache can be retrieved lazily, via a callable
+
+    from werkzeug.contrib.cache import SimpleCache
+    from LulzHistory.utils import cached
+
+    cache = SimpleCache(default_timeout=120)
+    get_cache = mock.Mock(return_value=cache)
+    calls = {'myfunc': 0}
+
+    @cached(get_cache, 30, 'myfunc/{0}')
+    def myfunc(arg):
+        calls['myfunc'] += 1
+        return "Retval #{0}".format(arg)
+
+    assert get_cache.call_count == 0  # Not needed until first call
+
+    assert myfunc(0) == 'Retval #0'
+    assert myfunc(0) == 'Retval #0'
+    assert calls['myfunc'] == 1
+    assert get_cache.call_count == 2
+    assert cache.get('myfunc/0') == 'Retval #0'
+
+
 def test_image_filename_match():
-    from LulzHistory.views import img_file_re
+    from LulzHistory.state import AppState
+    img_file_re = AppState({}).img_file_re
     should_match = [
         'a0b1c2d3e4.jpg',
         '0123456789abcdef0123456789abcdef01234567.jpg',
@@ -26,7 +26,10 @@ def cached(cache, timeout=5 * 60, key=None):
     Decorator for caching function return values.
 
     :param cache:
-        The cache object to be used for caching
+        The cache object to be used for caching.
+        If it's a callable, it will be called (with no
+        arguments) each time the cache is needed, to get
+        the actual cache object.
 
     :param timeout:
         The cache timeout, in seconds
@@ -57,14 +60,16 @@ def cached(cache, timeout=5 * 60, key=None):
                 ## explicit about which key to use..
                 raise ValueError("Unspecified cache key")
 
+            _cache = cache() if hasattr(cache, '__call__') else cache
+
             ## First, try getting from cache
-            rv = cache.get(cache_key)
+            rv = _cache.get(cache_key)
             if rv is not None:
                 return rv
 
             ## Not found, we need to run the actual function
             rv = f(*args, **kwargs)
-            cache.set(cache_key, rv, timeout=timeout)
+            _cache.set(cache_key, rv, timeout=timeout)
             return rv
 
         return decorated_function
@@ -19,30 +19,25 @@ Views
 """
 
 from functools import partial
-import re
 
 from flask import render_template, session, request, redirect, url_for
-from werkzeug.contrib.cache import SimpleCache
 
-from . import app
 from . import github
+from .blueprint import bp
 from .const import PICS_REPO_NAME
 from .github import HTTPError
+from .mirror import MirrorError, gravatar_url
+from .state import get_state
 from .utils import cached as cached_decorator
 
 
 ## Caching-related stuff
-cache = SimpleCache(default_timeout=120)
-cached = partial(cached_decorator, cache)
+cached = partial(cached_decorator, lambda: get_state().cache)
 
-## Regexp for image files.
-## We pre compile and keep it there in order to
-## be able to unit-test it, not for performance reasons..
-img_file_re = re.compile(r'^[0-9a-f]{10,40}\.(jpg|gif|png)$')
 
-
-@app.context_processor
+@bp.app_context_processor
 def add_user_info():
+    cache = get_state().cache
     user = cache.get('user_profile')
     if user is None:
         try:
@@ -58,7 +53,7 @@ def add_user_info():
     return dict(user=user)
 
 
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")
 
@@ -98,15 +93,15 @@ def request_all(url, params=None):
             yield item
 
 
-@app.route('/goto')
+@bp.route('/goto')
 def goto():
     repo = request.args['repo'].split('/')
     if len(repo) != 2:
         return ("Bad repo name", 400)
-    return redirect(url_for('lulz_history', owner=repo[0], repo=repo[1]))
+    return redirect(url_for('.lulz_history', owner=repo[0], repo=repo[1]))
 
 
-@app.route('/repo/<owner>/')
+@bp.route('/repo/<owner>/')
 def repo_index(owner):
     title = u"Repositories for {}".format(owner)
     url = '/users/{}/repos'.format(owner)
@@ -114,6 +109,7 @@ def repo_index(owner):
         'sort': 'updated',
         'direction': 'desc',
     }
+    cache = get_state().cache
     cache_key = '/users/{}/repos'.format(owner)
     data = cache.get(cache_key)
     if data:
@@ -124,8 +120,53 @@ def repo_index(owner):
     return render_template("repos-index.html", repos=repos, title=title)
 
 
+def get_commit_author(owner, repo, sha, email):
+    """
+    Find the GitHub user who authored a commit, when the mirror
+    can't tell from the email alone.
+
+    We ask the API about one commit, and cache the result by
+    email, so that we only ask once for each author. Failures
+    (eg. rate limit exceeded) are cached too, for a shorter time.
+    """
+    cache = get_state().cache
+    cache_key = 'commit_author:{0}'.format(email.lower())
+    data = cache.get(cache_key)
+    if data is None:
+        url = '/repos/{owner}/{repo}/commits/{sha}'.format(
+            owner=owner, repo=repo, sha=sha)
+        try:
+            author = github.request('GET', url).json()['author']
+        except HTTPError:
+            data, timeout = {'author': None}, 5 * 60
+        else:
+            ## Wrapped, as the author might be None (not a GitHub user)
+            data, timeout = {'author': author}, 24 * 60 * 60
+        cache.set(cache_key, data, timeout=timeout)
+    return data['author']
+
+
 @cached(5*60, '/repos/{owner}/{repo}/commits?sha={branch}')
 def get_commits(owner, repo, branch):
+    mirror = get_state().git_mirror
+    if mirror is not None and mirror.is_mirrored(owner, repo):
+        try:
+            commits = mirror.get_commits(owner, repo, branch=branch)
+        except MirrorError:
+            pass  # Fall back to the API
+        else:
+            ## Commits are newest first, so we ask about the
+            ## latest commit of each author (only once)
+            authors = {}
+            for commit in commits:
+                if commit['author'] is None:
+                    email = commit['commit']['author']['email'].lower()
+                    if email not in authors:
+                        authors[email] = get_commit_author(
+                            owner, repo, commit['sha'], email)
+                    commit['author'] = authors[email]
+            return commits
+
     url = '/repos/{owner}/{repo}/commits'.format(
         owner=owner, repo=repo)
 
@@ -140,6 +181,13 @@ def get_commits(owner, repo, branch):
 
 @cached(5*60, '/repos/{owner}/{repo}/branches')
 def list_branches(owner, repo):
+    mirror = get_state().git_mirror
+    if mirror is not None and mirror.is_mirrored(owner, repo):
+        try:
+            return mirror.list_branches(owner, repo)
+        except MirrorError:
+            pass  # Fall back to the API
+
     url = '/repos/{owner}/{repo}/branches'.format(owner=owner, repo=repo)
     return list(request_all(url))
 
@@ -166,26 +214,44 @@ def get_repo_pics(owner, repo):
     Scan a repository and find all the pictures in sub-directories.
     Returns a dictionary with ``{'commit_sha': 'picture_url'}``
     """
-    branch = get_repo_default_branch(owner=owner, repo=repo)
+    img_file_re = get_state().img_file_re
     found = {}
 
+    def add_picture(branch, path):
+        ## Is this a suitable picture?
+        name = path.rsplit('/', 1)[-1]
+        if img_file_re.match(name):
+            sha = name.split('.', 1)[0]
+            file_url = '{base}/{owner}/{repo}/{branch}/{path}'\
+                       ''.format(
+                           base='https://raw.github.com',
+                           owner=owner,
+                           repo=repo,
+                           branch=branch,
+                           path=path)
+            found[sha] = file_url
+
+    mirror = get_state().git_mirror
+    if mirror is not None:
+        try:
+            branch = mirror.get_default_branch(owner, repo)
+            paths = mirror.list_files(owner, repo, branch)
+        except MirrorError:
+            pass  # No pictures repo, or can't clone it: ask the API
+        else:
+            for path in paths:
+                add_picture(branch, path)
+            return found
+
+    branch = get_repo_default_branch(owner=owner, repo=repo)
+
     def scan_subtree(url):
         resp = github.request('GET', url)
         for item in resp.json():
             if item['type'] == 'dir':
                 scan_subtree(item['url'])
             elif item['type'] == 'file':
-                ## Is this a suitable picture?
-                if img_file_re.match(item['name']):
-                    sha = item['name'].split('.', 1)[0]
-                    file_url = '{base}/{owner}/{repo}/{branch}/{path}'\
-                               ''.format(
-                                   base='https://raw.github.com',
-                                   owner=owner,
-                                   repo=repo,
-                                   branch=branch,
-                                   path=item['path'])
-                    found[sha] = file_url
+                add_picture(branch, item['path'])
     try:
         scan_subtree('/repos/{owner}/{repo}/contents'
                      ''.format(owner=owner, repo=repo))
@@ -196,8 +262,8 @@ def get_repo_pics(owner, repo):
     return found
 
 
-@app.route('/repo/<owner>/<repo>/')
-@app.route('/repo/<owner>/<repo>/<branch>/')
+@bp.route('/repo/<owner>/<repo>/')
+@bp.route('/repo/<owner>/<repo>/<branch>/')
 def lulz_history(owner=None, repo=None, branch=None):
     """
     The actual page showing the history.
@@ -218,8 +284,8 @@ def lulz_history(owner=None, repo=None, branch=None):
         branches=branches)
 
 
-@app.route('/repo/<owner>/<repo>/commits')
-@app.route('/repo/<owner>/<repo>/<branch>/commits')
+@bp.route('/repo/<owner>/<repo>/commits')
+@bp.route('/repo/<owner>/<repo>/<branch>/commits')
 def history_commits(owner=None, repo=None, branch=None):
     """
     Returns the "inner" part of the history.
@@ -244,6 +310,12 @@ def history_commits(owner=None, repo=None, branch=None):
                 return val
 
     for commit in commits:
+        if commit['author'] is None:
+            ## Not a GitHub user we know of
+            commit['pic'] = gravatar_url(commit['commit']['author']['email'])
+            commit['is_lulz'] = False
+            continue
+
         pic = find_pic(all_pics[commit['author']['login']], commit['sha'])
 
         if pic is not None:
@@ -0,0 +1,12 @@
+"""
+WSGI entry point, for use with pre-forking servers.
+
+Configuration is loaded from the file pointed by ``LULZ_CONF``
+and all the shared state is built right away, eg::
+
+    gunicorn --preload -w 4 LulzHistory.wsgi:application
+"""
+
+from LulzHistory import create_app
+
+application = create_app(preload=True)
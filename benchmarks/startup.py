@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Startup benchmark for Lulz History.
+
+Measures:
+
+* the time needed to import the package, and to import it and
+  build a fully-loaded application (what used to happen on
+  ``import LulzHistory``)
+
+* the private memory of forked workers when the application
+  is built in each worker, versus when it's built (preloaded)
+  once in the master process before forking
+
+Usage::
+
+    python benchmarks/startup.py [--runs=N] [--workers=N]
+
+(from the repository root, so that ``LulzHistory`` can be imported,
+and with ``LULZ_CONF`` pointing to a configuration file, as for the
+real server).
+
+Memory figures are read from ``/proc``, so they're only
+available on Linux.
+"""
+
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+IMPORT_SNIPPETS = [
+    ('import LulzHistory', "import LulzHistory"),
+    ('create_app()', "from LulzHistory import create_app; create_app()"),
+    ('create_app(preload=True)',
+     "from LulzHistory import create_app; create_app(preload=True)"),
+]
+
+
+def time_snippet(code, runs):
+    """Best wall-clock time of running ``code`` in a fresh interpreter"""
+    timings = []
+    for _ in xrange(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def private_memory(pid):
+    """Private (not shared with other processes) memory, in kB"""
+    total = 0
+    with open('/proc/{0}/smaps'.format(pid)) as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total
+
+
+def measure_workers(preload, workers):
+    """
+    Fork ``workers`` processes, either after preloading the
+    application in the master or building it in each worker,
+    and return the average private memory of the workers.
+    """
+    from LulzHistory import create_app
+    from LulzHistory.state import get_state
+
+    if preload:
+        app = create_app(preload=True)
+
+    pids, pipes = [], []
+    for _ in xrange(workers):
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(rfd)
+            if not preload:
+                app = create_app(preload=True)
+            ## Simulate some work: the shared objects are used
+            get_state(app).img_file_re.match('0123456789.jpg')
+            os.write(wfd, b'x')
+            time.sleep(3600)
+            os._exit(0)
+        os.close(wfd)
+        pids.append(pid)
+        pipes.append(rfd)
+
+    try:
+        for rfd in pipes:
+            os.read(rfd, 1)  # Wait for the worker to be ready
+            os.close(rfd)
+        return sum(private_memory(pid) for pid in pids) / float(workers)
+    finally:
+        for pid in pids:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+
+
+def measure_in_subprocess(preload, workers):
+    ## Run in a clean interpreter, as measuring one mode in the
+    ## same process would affect the other..
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = ("import sys; sys.path[:0] = [{0!r}, {1!r}]; "
+            "from startup import measure_workers; "
+            "print(measure_workers({2!r}, {3!r}))"
+            "".format(here, os.path.dirname(here), preload, workers))
+    return float(subprocess.check_output([sys.executable, '-c', code]))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--runs', action='store', dest='runs', default="10")
+    parser.add_option('--workers', action='store', dest='workers',
+                      default="4")
+    opts, args = parser.parse_args()
+    runs, workers = int(opts.runs), int(opts.workers)
+
+    print("Startup time (best of {0} runs)".format(runs))
+    baseline = time_snippet("pass", runs)
+    for label, code in IMPORT_SNIPPETS:
+        elapsed = time_snippet(code, runs) - baseline
+        print("    {0:<30} {1:8.1f} ms".format(label, elapsed * 1000))
+
+    if not os.path.exists('/proc/self/smaps'):
+        print("Per-worker memory: not available on this platform")
+        return
+
+    print("Per-worker private memory ({0} workers)".format(workers))
+    for label, preload in [('built in each worker', False),
+                           ('preloaded in master', True)]:
+        mem = measure_in_subprocess(preload, workers)
+        print("    {0:<30} {1:8.0f} kB".format(label, mem))
+
+
+if __name__ == '__main__':
+    main()
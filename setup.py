@@ -34,9 +34,17 @@ setup(
         'requests',
         'rauth',
     ],
+    extras_require={
+        ## Minification and brotli compression of static assets
+        'assets': ['rcssmin', 'rjsmin', 'brotli'],
+    },
     entry_points={
         'console_scripts': [
             'lulz-history = LulzHistory.server:run_from_command_line',
+            'lulz-build-assets = '
+            'LulzHistory.server:build_assets_from_command_line',
+            'lulz-update-mirrors = '
+            'LulzHistory.server:update_mirrors_from_command_line',
         ],
     },
     classifiers=[